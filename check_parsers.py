@@ -0,0 +1,101 @@
+"""
+Check that the compiled respcodec parser and the pure Python one in redis.py agree.
+
+Every frame of a shared corpus, every prefix of it and a set of randomly mutated copies are
+fed to parse_command and parse_resp_command, and the arguments after each frame's first line
+to parse_args and parse_resp_args. Both must return the same result or raise the same
+exception.
+Run it after building respcodec:
+    python check_parsers.py
+"""
+import random
+import sys
+
+import respcodec
+from redis import MAX_BULK_LENGTH, parse_resp_args, parse_resp_command
+
+CORPUS = [
+    b"*1\r\n$4\r\nPING\r\n",
+    b"*2\r\n$3\r\nGET\r\n$1\r\nk\r\n",
+    b"*3\r\n$3\r\nSET\r\n$3\r\nkey\r\n$10\r\n0123456789\r\n",
+    b"*2\r\n$4\r\nECHO\r\n$0\r\n\r\n",
+    b"*-1\r\n",
+    b"*0\r\n",
+    b"*1\r\n$-1\r\n",
+    b"*1\r\n$-12\r\n",
+    b"*-5\r\n",
+    b"*-01\r\n",
+    b"*-0\r\n",
+    b"*2\r\n$3\r\nGET\r\n$-9\r\n",
+    b"*3\r\n$3\r\nSET\r\n$-1\r\n$1\r\nv\r\n",
+    b"*1\r\n$\r\n",
+    b"*\r\n",
+    b"*-\r\n",
+    b"*1\r\n$3\r\nGETxx\r\n",
+    b"*1\r\n$3\r\nGET\rx",
+    b"*1\r\n$99999999999999999999999\r\n",
+    b"*1\r\n$999999999999999999\r\n",
+    b"*1\r\n$%d\r\n" % MAX_BULK_LENGTH,
+    b"*1\r\n$%d\r\n" % (MAX_BULK_LENGTH + 1),
+    b"*1\r\n$+3\r\nGET\r\n",
+    b"*1\r\n$ 3\r\nGET\r\n",
+    b"*1\r\n$1_0\r\nabcdefghij\r\n",
+    b"*1\r\n$3x\r\nGET\r\n",
+    b"*1\r\n$3\rx\nGET\r\n",
+    b"*1\r\n:5\r\n",
+    b"*1\r\n+GET\r\n",
+    b"*1\r\n-ERR\r\n",
+    b"*1\r\n*1\r\n$3\r\nGET\r\n",
+    b"*2\r\n$1\r\na\r\n*1\r\n$1\r\nb\r\n",
+    b"+PING\r\n",
+    b"$4\r\nPING\r\n",
+    b"PING\r\n",
+    b"*1\r\n$4\r\nPING\r\n*1\r\n$4\r\nPING\r\n",
+]
+
+
+def outcome(parse, frame, start=0):
+    """Return what the parser makes of the frame: its result, or the type of the exception."""
+    try:
+        return parse(bytearray(frame), start, len(frame))
+    except (IndexError, ValueError) as e:
+        return type(e).__name__
+
+
+def args_outcome(parse, frame):
+    """Return what the argument parser makes of the frame after its first line."""
+    args = []
+    result = outcome(lambda buf, start, end: parse(buf, start, end, args, 3), frame, frame.find(b"\n") + 1)
+    return result, args
+
+
+def frames():
+    """Yield the corpus, every prefix of each frame and randomly mutated copies."""
+    rng = random.Random(0)
+    for frame in CORPUS:
+        for length in range(len(frame) + 1):
+            yield frame[:length]
+        for _ in range(200):
+            mutated = bytearray(frame)
+            mutated[rng.randrange(len(mutated))] = rng.choice(b"*$:+-\r\n0123456789x")
+            yield bytes(mutated)
+
+
+def main():
+    mismatches = 0
+    checked = 0
+    for frame in frames():
+        checked += 1
+        for compiled, python in (
+            (outcome(respcodec.parse_command, frame), outcome(parse_resp_command, frame)),
+            (args_outcome(respcodec.parse_args, frame), args_outcome(parse_resp_args, frame)),
+        ):
+            if compiled != python:
+                mismatches += 1
+                print(f"{frame!r}: respcodec {compiled!r}, Python {python!r}")
+    print(f"{checked} frames checked, {mismatches} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
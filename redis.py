@@ -1,8 +1,75 @@
+import argparse
+import asyncio
+import logging
+import mmap
 import os
-import pickle
+import random
+import re
 import selectors
+import signal
 import socket
+import struct
+import threading
 import time
+import traceback
+from collections import deque
+from itertools import islice
+
+try:
+    from respcodec import parse_args, parse_command
+except ImportError:  # The compiled parser is optional, see respcodec.pyx
+    parse_args = parse_command = None
+
+try:
+    import uvloop
+except ImportError:  # uvloop is optional, asyncio's own event loop is used without it
+    uvloop = None
+
+logger = logging.getLogger(__name__)
+
+RESP_OK = b"+OK\r\n"
+RESP_PONG = b"+PONG\r\n"
+RESP_NIL = b"$-1\r\n"
+RESP_ZERO = b":0\r\n"
+RESP_ONE = b":1\r\n"
+RESP_PROTOCOL_ERROR = b"-ERR Protocol error\r\n"
+INT_REPLY_CACHE = {i: b":%d\r\n" % i for i in range(-128, 1024)}
+BULK_HEADERS = [b"$%d\r\n" % i for i in range(256)]
+
+RECV_BUFFER_SIZE = 64 * 1024
+LOWER_CACHE_SIZE = 64
+EXPIRE_INTERVAL = 0.1
+EXPIRE_SAMPLE_SIZE = 20
+EXPIRE_TIME_LIMIT = 0.025
+LARGE_BULK_SIZE = 16 * 1024
+MAX_LENGTH_DIGITS = 18
+MAX_BULK_LENGTH = 512 * 1024 * 1024  # Redis's proto-max-bulk-len
+MAX_QUERY_BUFFER_SIZE = 1024 * 1024 * 1024  # Redis's client-query-buffer-limit
+INT64_MIN, INT64_MAX = -(1 << 63), (1 << 63) - 1
+INT_VALUE_RE = re.compile(rb"0|-?[1-9][0-9]*")
+IOV_MAX = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") else 1024
+HAVE_SENDMSG = hasattr(socket.socket, "sendmsg")  # Not available on Windows
+
+DUMP_FILE = "dump.rdb"
+WORKER_DUMP_FILE = "dump-{}.rdb"
+SNAPSHOT_MAGIC = b"MREDIS01"
+SNAPSHOT_FLUSH_SIZE = 1 << 20
+SNAPSHOT_BYTES, SNAPSHOT_INT, SNAPSHOT_LIST = 0, 1, 2
+SNAPSHOT_ENTRY = struct.Struct("<IB")
+SNAPSHOT_LEN = struct.Struct("<I")
+SNAPSHOT_INT_VALUE = struct.Struct("<q")
+SNAPSHOT_EXPIRY = struct.Struct("<d")
+
+
+def serialize_int(n):
+    """Serialize an integer into a RESP integer reply, using the cached replies for common values."""
+    return INT_REPLY_CACHE.get(n) or b":%d\r\n" % n
+
+
+def serialize_bulk(data):
+    """Serialize bytes into a RESP bulk string, using the cached length headers for short values."""
+    length = len(data)
+    return b"".join((BULK_HEADERS[length] if length < 256 else b"$%d\r\n" % length, data, b"\r\n"))
 
 
 class Error:
@@ -12,222 +79,943 @@ class Error:
         self.message = message
 
 
+def serialize_str(data):
+    """Serialize a str into a RESP bulk string of its UTF-8 encoding."""
+    return serialize_bulk(data.encode())
+
+
+def serialize_array(items):
+    """Serialize a list or deque into a RESP array of its serialized items."""
+    return b"*%d\r\n%s" % (len(items), b"".join([serialize(item) for item in items]))
+
+
+def serialize_error(error):
+    """Serialize an Error into a RESP error reply."""
+    return b"-%s\r\n" % error.message.encode()
+
+
+SERIALIZERS = {
+    bytes: serialize_bulk,
+    int: serialize_int,
+    type(None): lambda _: RESP_NIL,
+    list: serialize_array,
+    deque: serialize_array,
+    str: serialize_str,
+    Error: serialize_error,
+}
+
+
+def serialize(data):
+    """
+    Serialize the data into RESP format.
+
+    The serializer is looked up by the exact type of the data in SERIALIZERS; subclasses
+    of the supported types take the slower isinstance path.
+    """
+    serializer = SERIALIZERS.get(type(data))
+    if serializer is None:
+        for data_type, serializer in SERIALIZERS.items():
+            if isinstance(data, data_type):
+                break
+        else:
+            raise TypeError("Unsupported RESP type")
+    return serializer(data)
+
+
+def parse_length(buf, pos, crlf):
+    """
+    Parse the length of the "*" or "$" header at `pos`, the same way respcodec does.
+
+    Only plain decimal digits are accepted, at most MAX_LENGTH_DIGITS of them, plus -1.
+    """
+    digits = buf[pos + 1 : crlf]
+    negative = digits[:1] == b"-"
+    if negative:
+        digits = digits[1:]
+    if not digits.isdigit() or len(digits) > MAX_LENGTH_DIGITS:
+        raise ValueError("Invalid RESP message")
+    length = int(digits)
+    if negative:
+        if length != 1:
+            raise ValueError("Invalid RESP message")
+        return -1
+    return length
+
+
+def parse_header(buf, pos, limit):
+    """
+    Parse the "*" or "$" header line of a command at `pos`, the same way respcodec does.
+
+    Returns the length and the offset just past the CRLF. Raises IndexError while the line is
+    incomplete, and ValueError as soon as it can no longer turn into a valid length.
+    """
+    crlf = buf.find(b"\r\n", pos, limit)
+    if crlf == -1:
+        line = buf[pos + 1 : min(limit, pos + MAX_LENGTH_DIGITS + 3)]
+        cr = line.find(b"\r")
+        if cr != -1:
+            if cr + 1 < len(line):  # A CR that is not followed by LF
+                raise ValueError("Invalid RESP message")
+            line = line[:cr]
+        if line[:1] == b"-":
+            line = line[1:]
+        if len(line) > MAX_LENGTH_DIGITS or (line and not line.isdigit()):
+            raise ValueError("Invalid RESP message")
+        raise IndexError("Incomplete RESP message")
+    if crlf == pos + 2 and 0x30 <= buf[pos + 1] <= 0x39:  # Single digit length
+        return buf[pos + 1] - 0x30, crlf + 2
+    return parse_length(buf, pos, crlf), crlf + 2
+
+
+def parse_resp_command(buf, start=0, end=None):
+    """
+    Parse the RESP array of bulk strings found at `start` in the buffer.
+
+    This is the pure Python version of respcodec.parse_command and accepts exactly the same
+    input: anything other than bulk strings inside the array is a ValueError. Only the bytes
+    before `end` (the end of the buffer by default) are considered part of the received data.
+    Returns a tuple of the list of bulk strings (as bytes) and the number of bytes consumed.
+    Raises IndexError if the buffer does not yet hold a complete message.
+    """
+    limit = len(buf) if end is None else min(end, len(buf))
+    pos = start
+    if pos >= limit:
+        raise IndexError("Incomplete RESP message")
+    if buf[pos] != 0x2A:  # "*"
+        raise ValueError("Invalid RESP message")
+    count, pos = parse_header(buf, pos, limit)
+    if count == -1:
+        return None, pos - start
+    args = []
+    pos += parse_resp_args(buf, pos, limit, args, count)
+    if len(args) < count:
+        raise IndexError("Incomplete RESP message")
+    return args, pos - start
+
+
+def parse_resp_args(buf, start, end, args, count):
+    """
+    Append up to `count` of the bulk strings found at `start` in the buffer to `args`.
+
+    This is the pure Python version of respcodec.parse_args. Parsing stops at the first bulk
+    string that has not been received completely, so a large command can be parsed a piece
+    at a time as it arrives. Returns the number of bytes consumed by the appended arguments.
+    Raises ValueError for anything that is not a non-null bulk string of at most MAX_BULK_LENGTH
+    bytes.
+    """
+    pos = start
+    with memoryview(buf) as mv:
+        for _ in range(count):
+            if pos >= end:
+                break
+            if buf[pos] != 0x24:  # "$"
+                raise ValueError("Invalid RESP message")
+            try:
+                length, data_start = parse_header(buf, pos, end)
+            except IndexError:
+                break
+            if length == -1 or length > MAX_BULK_LENGTH:  # No null bulk strings inside a command
+                raise ValueError("Invalid RESP message")
+            data_end = data_start + length
+            if data_end + 2 > end:
+                break
+            if buf[data_end] != 0x0D or buf[data_end + 1] != 0x0A:
+                raise ValueError("Invalid RESP message")
+            args.append(bytes(mv[data_start:data_end]))
+            pos = data_end + 2
+    return pos - start
+
+
+def make_selector():
+    """Return the most efficient selector available on this platform, preferring epoll or kqueue."""
+    if hasattr(selectors, "EpollSelector"):
+        return selectors.EpollSelector()
+    if hasattr(selectors, "KqueueSelector"):
+        return selectors.KqueueSelector()
+    return selectors.DefaultSelector()
+
+
+class InputBuffer:
+    """
+    Reusable receive buffer of a client connection.
+
+    Data is received straight into the free space at the end of `buf` and commands are
+    parsed from it in place, so no bytes object is created per read.
+    - rpos: start of the data that has not been parsed yet.
+    - wpos: end of the data received so far.
+    - args: arguments parsed so far of a command that has not been received completely, or None.
+    - argc: number of arguments that command has.
+    """
+
+    __slots__ = ("buf", "rpos", "wpos", "args", "argc")
+
+    def __init__(self):
+        self.buf = bytearray(RECV_BUFFER_SIZE)
+        self.rpos = 0
+        self.wpos = 0
+        self.args = None
+        self.argc = 0
+
+    def free_space(self):
+        """Returns a memoryview of the free space at the end of the buffer, making room first if it is full."""
+        if self.wpos == len(self.buf):
+            if self.rpos:
+                remaining = self.wpos - self.rpos
+                self.buf[:remaining] = self.buf[self.rpos : self.wpos]
+                self.rpos, self.wpos = 0, remaining
+            else:
+                # A single command larger than the buffer, so grow it
+                self.buf += bytes(len(self.buf))
+        elif self.wpos == 0 and len(self.buf) > RECV_BUFFER_SIZE:
+            # Give back the memory of a large command once it has been processed
+            self.buf = bytearray(RECV_BUFFER_SIZE)
+        return memoryview(self.buf)[self.wpos :]
+
+
 class RedisServer:
     """
     A Simple Redis server implementation following RESP (Redis Serialization Protocol) spec.
 
     This server supports basic Redis commands such as PING, ECHO, EXISTS, DEL,
-    INCR, DECR, LPUSH, RPUSH, GET, SET, SAVE, and uses the selectors module
+    INCR, DECR, LPUSH, RPUSH, GET, SET, SAVE, BGSAVE, and uses the selectors module
     to handle multiple concurrent clients.
 
     Attributes:
     - host (str): The IP address the server listens on (default is "127.0.0.1").
     - port (int): The port number the server listens on (default is 6379).
-    - data_storage (dict): Dictionary to store key-value pairs representing the Redis data.
-    - sel (selectors.DefaultSelector): A selector object for handling multiple concurrent clients.
+    - reuse_port (bool): Whether to bind with SO_REUSEPORT so several worker processes can share the port.
+    - dump_file (str): Path of the snapshot file written by SAVE and BGSAVE and loaded at startup (default is "dump.rdb").
+    - data_storage (dict): Dictionary mapping bytes keys to mutable [value, expiry] entries representing the Redis data.
+    - buffers (dict): Per-client input buffers (InputBuffer) keyed by socket file descriptor.
+    - outbufs (dict): Per-client lists of pending response fragments (bytes) keyed by socket file descriptor.
+    - writing (set): File descriptors of clients with pending output, watched for EVENT_WRITE.
+    - sel (selectors.BaseSelector): A selector object (epoll or kqueue where available) for handling multiple concurrent clients.
 
     Methods:
     - start(): Start the Redis server, listening for incoming connections.
+    - start_asyncio(): Start the Redis server on an asyncio (or uvloop) event loop instead.
+    - expire_sample(): Evict expired keys found in a random sample of the keys with an expiry.
     - accept(sock, mask): Callback for handling new client connections.
     - handle_client(client_socket, mask): Callback for handling client requests.
-    - process_command(command): Process the Redis command and generate a response.
+    - process_input(inbuf, responses): Process every complete command in a client's input buffer.
+    - flush(client_socket): Send the pending output of a client.
+    - close_client(client_socket): Unregister and close a client connection.
+    - process_command(command): Process the parsed Redis command and generate a response.
+    - _cmd_<name>(args): Handler for a single command, looked up by its lowercase name.
     - serialize_resp(data): Serialize the data into RESP (REdis Serialization Protocol) format.
-    - deserialize_resp(message): Deserialize the RESP message into Python data.
-    - load_data(): Load previously saved data from a file ("dump.pkl").
+    - serialize_fragments(data): Serialize the data into RESP, keeping large bulk strings as separate fragments.
+    - write_snapshot(path, entries): Write (key, value, expiry) entries to a binary snapshot file.
+    - read_snapshot(data): Read the entries of a binary snapshot into a data storage dict.
+    - load_data(): Load previously saved data from the snapshot file (dump_file).
     """
 
-    def __init__(self, host="127.0.0.1", port=6379) -> None:
+    def __init__(self, host="127.0.0.1", port=6379, reuse_port=False, dump_file=DUMP_FILE) -> None:
         """Initialize the Redis server with the specified host and port."""
         self.host = host
         self.port = port
+        self.reuse_port = reuse_port
+        self.dump_file = dump_file
         self.data_storage = {}
-        self.sel = selectors.DefaultSelector()
+        self.buffers = {}
+        self.outbufs = {}
+        self.writing = set()
+        self.sel = make_selector()
+        self._parse_command = parse_command or parse_resp_command
+        self._parse_args = parse_args or parse_resp_args
+        self._dispatch = {
+            b"ping": self._cmd_ping,
+            b"echo": self._cmd_echo,
+            b"get": self._cmd_get,
+            b"set": self._cmd_set,
+            b"del": self._cmd_del,
+            b"exists": self._cmd_exists,
+            b"incr": self._cmd_incr,
+            b"decr": self._cmd_decr,
+            b"lpush": self._cmd_lpush,
+            b"rpush": self._cmd_rpush,
+            b"save": self._cmd_save,
+            b"bgsave": self._cmd_bgsave,
+        }
+        # b"" never names a command, so it can stand in for "no previous command"
+        self._last_name, self._last_handler = b"", self._cmd_invalid
+        self._lower_cache = {}
+        for word in (*self._dispatch, b"ex", b"px", b"exat", b"pxat"):
+            self._lower_cache[word] = word
+            self._lower_cache[word.upper()] = word
+        self._bgsave_thread = None
+        self._expiring = set()
+        self._expiring_keys = []
 
     def start(self):
         """Starts the server and listens for incoming connections."""
         self.load_data()
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
+            if self.reuse_port:
+                server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             server_socket.bind((self.host, self.port))
             server_socket.listen()
             server_socket.setblocking(False)
             self.sel.register(server_socket, selectors.EVENT_READ, self.accept)
             print(f"Redis server listening on {self.host}: {self.port}")
+            last_expire = time.monotonic()
             try:
                 while True:
-                    events = self.sel.select(timeout=None)
+                    events = self.sel.select(timeout=EXPIRE_INTERVAL if self._expiring else None)
                     for key, mask in events:
                         callback = key.data
                         callback(key.fileobj, mask)
+                    now = time.monotonic()
+                    if now - last_expire >= EXPIRE_INTERVAL:  # Sample at a fixed rate, like asyncio mode
+                        last_expire = now
+                        self.expire_sample()
             except KeyboardInterrupt:
                 print("Caught keyboard interrupt, exiting")
 
+    def start_asyncio(self):
+        """Starts the server on an asyncio event loop, using uvloop when it is installed."""
+        self.load_data()
+        run = uvloop.run if uvloop is not None else asyncio.run
+        try:
+            run(self._serve_asyncio())
+        except KeyboardInterrupt:
+            print("Caught keyboard interrupt, exiting")
+
+    async def _serve_asyncio(self):
+        """Serves clients with RespProtocol until the event loop is stopped."""
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(
+            lambda: RespProtocol(self), self.host, self.port, reuse_port=self.reuse_port or None
+        )
+        print(f"Redis server listening on {self.host}: {self.port}")
+        expire_task = asyncio.create_task(self._expire_periodically())
+        async with server:
+            await server.serve_forever()
+        expire_task.cancel()
+
+    async def _expire_periodically(self):
+        """Runs expire_sample every EXPIRE_INTERVAL seconds."""
+        while True:
+            await asyncio.sleep(EXPIRE_INTERVAL)
+            self.expire_sample()
+
+    def expire_sample(self):
+        """
+        Evicts expired keys found in a random sample of the keys that have an expiry.
+
+        Keys that are never read again would otherwise only be removed lazily by GET, so like
+        Redis the sampling is repeated for as long as more than a quarter of a sample had expired,
+        but for at most EXPIRE_TIME_LIMIT seconds per call so clients are never stalled for long;
+        whatever is left is picked up again on the next call.
+        The sample is drawn from a cached list of the expiring keys that is only rebuilt once
+        the set has changed size by more than a quarter, or when most of a sample turns out to
+        be keys that no longer expire.
+        """
+        expiring = self._expiring
+        started = time.time()
+        while expiring:
+            keys = self._expiring_keys
+            if abs(len(expiring) - len(keys)) * 4 > len(keys):
+                keys = self._expiring_keys = list(expiring)
+            now = time.time()
+            expired = 0
+            stale = 0
+            sample = random.sample(keys, min(EXPIRE_SAMPLE_SIZE, len(keys)))
+            for key in sample:
+                if key not in expiring:
+                    stale += 1
+                    continue
+                entry = self.data_storage.get(key)
+                if entry is None or entry[1] is None:
+                    expiring.discard(key)
+                    stale += 1
+                elif entry[1] < now:
+                    del self.data_storage[key]
+                    expiring.discard(key)
+                    expired += 1
+            if now - started > EXPIRE_TIME_LIMIT:
+                break
+            if stale * 2 > len(sample):
+                # Most of the cached keys were replaced without the set changing size, so the
+                # sample says nothing about the keys that are really expiring now
+                self._expiring_keys = list(expiring)
+                continue
+            if expired * 4 <= len(sample):
+                break
+
     def accept(self, sock, mask):
         """Accepts a new client connection and registers it with the selector."""
         client_socket, client_address = sock.accept()
-        print(f"Accepted connection from {client_address}")
+        logger.debug("Accepted connection from %s", client_address)
         client_socket.setblocking(False)
+        self.buffers[client_socket.fileno()] = InputBuffer()
+        self.outbufs[client_socket.fileno()] = []
         self.sel.register(client_socket, selectors.EVENT_READ, self.handle_client)
 
     def handle_client(self, client_socket, mask):
         """
         Handles a client requests.
 
-        This method reads a command from the client, processes it, and sends back a response.
+        This method receives data from the client straight into its input buffer, processes every
+        complete command found there, and sends back all of the responses in a single write.
+        A trailing partial command is kept in the buffer until the rest of it arrives.
         If the client has disconnected, it unregisters the client socket from the selector and closes the socket.
         """
-        command = client_socket.recv(1024)
-        if command:
+        if mask & selectors.EVENT_WRITE:
+            if not self.flush(client_socket):
+                return
+        if not mask & selectors.EVENT_READ:
+            return
+        fd = client_socket.fileno()
+        inbuf = self.buffers[fd]
+        try:
+            nbytes = client_socket.recv_into(inbuf.free_space())
+        except BlockingIOError:
+            return
+        except ConnectionResetError:
+            nbytes = 0
+        if not nbytes:
+            self.close_client(client_socket)
+            return
+        inbuf.wpos += nbytes
+        outbuf = self.outbufs[fd]
+        if not self.process_input(inbuf, outbuf):
+            if self.flush(client_socket):
+                self.close_client(client_socket)
+            return
+        if outbuf and fd not in self.writing:
+            self.flush(client_socket)
+
+    def process_input(self, inbuf, responses):
+        """
+        Processes every complete command in the client's input buffer.
+
+        The responses are appended to the `responses` list of fragments. The arguments of a
+        trailing partial command are kept in `inbuf.args` as they arrive, so each byte is only
+        parsed once however many reads a large command takes.
+        Returns False if the client sent something that is not a valid command (a non-empty
+        array of non-null bulk strings) or more than MAX_QUERY_BUFFER_SIZE bytes of a single
+        argument; a protocol error reply is queued and the caller should close the connection
+        once it is sent.
+        """
+        buf, pos, end = inbuf.buf, inbuf.rpos, inbuf.wpos
+        while pos < end:
+            try:
+                if inbuf.args is None:
+                    command, consumed = self._parse_command(buf, pos, end)
+                    if consumed <= 0:
+                        command = None
+                    pos += consumed
+                else:
+                    # The rest of a command that was still incomplete after the previous read
+                    command = inbuf.args
+                    pos += self._parse_args(buf, pos, end, command, inbuf.argc - len(command))
+                    if len(command) < inbuf.argc:
+                        break
+                    inbuf.args = None
+            except IndexError:
+                pos = self._begin_partial(inbuf, buf, pos, end)
+                break
+            except ValueError:
+                command = None
+            if type(command) is not list or not command:
+                return self._protocol_error(inbuf, responses)
             response = self.process_command(command)
-            client_socket.sendall(response.encode())
+            if type(response) is bytes:
+                responses.append(response)
+            else:
+                responses.extend(response)
+        if pos == end:
+            inbuf.rpos = inbuf.wpos = 0
+        elif end - pos > MAX_QUERY_BUFFER_SIZE:
+            return self._protocol_error(inbuf, responses)
         else:
-            self.sel.unregister(client_socket)
-            client_socket.close()
-        with client_socket:
-            while True:
-                command = client_socket.recv(1024)
-                if not command:
-                    break
-                response = self.process_command(command)
-                client_socket.sendall(response.encode())
+            inbuf.rpos = pos
+        return True
 
-    def process_command(self, command):
-        """Process the Redis command and generate a response."""
-        deserialized = self.deserialize_resp(command)
-        if deserialized[0].lower() == "ping":
-            return self.serialize_resp("PONG")
-        elif deserialized[0].lower() == "echo":
-            return self.serialize_resp(deserialized[1])
-        elif deserialized[0].lower() == "exists":
-            key = deserialized[1]
-            return self.serialize_resp(1 if key in self.data_storage else 0)
-        elif deserialized[0].lower() == "del":
-            count = 0
-            for key in deserialized[1:]:
-                if key in self.data_storage:
-                    del self.data_storage[key]
-                    count += 1
-            return self.serialize_resp(count)
-        elif deserialized[0].lower() == "incr" or deserialized[0].lower() == "decr":
-            key = deserialized[1]
-            if key not in self.data_storage:
-                return self.serialize_resp("nil")
-            value, expiry = self.data_storage[key]
-            if isinstance(value, int):
-                self.data_storage[key] = (
-                    value + 1 if deserialized[0].lower() == "incr" else value - 1,
-                    expiry,
-                )
-                return self.serialize_resp(self.data_storage[key][0])
-            else:
-                return self.serialize_resp("value is not an integer")
-        elif deserialized[0].lower() == "lpush" or deserialized[0].lower() == "rpush":
-            key = deserialized[1]
-            values = deserialized[2:]
-            if key not in self.data_storage:
-                self.data_storage[key] = (values, None)
-            else:
-                existing_values, expiry = self.data_storage[key]
-                if not isinstance(existing_values, list):
-                    return self.serialize_resp("existing value is not a list")
-                if deserialized[0].lower() == "lpush":
-                    values.extend(existing_values)
-                else:
-                    existing_values.extend(values)
-                    values = existing_values
-                self.data_storage[key] = (values, expiry)
-            return self.serialize_resp(len(self.data_storage[key][0]))
-        elif deserialized[0].lower() == "get":
-            key = deserialized[1]
-            value, expiry = self.data_storage.get(key, ("nil", None))
-            if expiry is not None:
-                if time.time() > expiry:
-                    del self.data_storage[key]
-                    return self.serialize_resp("nil")
-            return self.serialize_resp(value)
-        elif deserialized[0].lower() == "set":
-            key, value = deserialized[1], deserialized[2]
-            ex, px, exat, pxat = None, None, None, None
-            if len(deserialized) > 3:
-                for i in range(3, len(deserialized), 2):
-                    option = deserialized[i].lower()
-                    if option == "ex":
-                        ex = int(deserialized[i + 1])
-                    elif option == "px":
-                        px = int(deserialized[i + 1]) / 1000
-                    elif option == "exat":
-                        exat = int(deserialized[i + 1])
-                        ex = exat - int(time.time())
-                    elif option == "pxat":
-                        pxat = int(deserialized[i + 1])
-                        px = (pxat - int(time.time() * 1000)) / 1000
-            expiry = ex or px
-            if expiry is not None:
-                self.data_storage[key] = (value, time.time() + expiry)
+    def _begin_partial(self, inbuf, buf, pos, end):
+        """
+        Keep the arguments received so far of the incomplete command at `pos`.
+
+        Returns the offset just past the last complete argument, where parsing resumes once
+        more data has arrived.
+        """
+        try:
+            count, pos = parse_header(buf, pos, end)
+        except IndexError:  # Not even the argument count has arrived yet
+            return pos
+        inbuf.args, inbuf.argc = [], count
+        return pos + self._parse_args(buf, pos, end, inbuf.args, count)
+
+    def _protocol_error(self, inbuf, responses):
+        """Queue a protocol error reply and drop the client's pending input."""
+        responses.append(RESP_PROTOCOL_ERROR)
+        inbuf.rpos = inbuf.wpos = 0
+        inbuf.args = None
+        return False
+
+    def flush(self, client_socket):
+        """
+        Sends as much of the client's pending output as the socket accepts.
+
+        The pending response fragments are handed to the kernel as one scatter/gather write
+        with sendmsg, so they are never copied into a single buffer first. Platforms without
+        sendmsg (Windows) join the fragments and send them with send instead.
+        The client is only watched for EVENT_WRITE while some output is still pending,
+        so the common case of a write that completes at once never touches the selector.
+        Returns False if the client disconnected and has been closed.
+        """
+        fd = client_socket.fileno()
+        outbuf = self.outbufs[fd]
+        fragments = outbuf[:IOV_MAX] if len(outbuf) > IOV_MAX else outbuf
+        try:
+            if HAVE_SENDMSG:
+                sent = client_socket.sendmsg(fragments)
             else:
-                self.data_storage[key] = (value, None)
-            return self.serialize_resp("OK")
-        elif deserialized[0].lower() == "save":
-            with open("dump.pkl", "wb") as f:
-                pickle.dump(self.data_storage, f)
-            return self.serialize_resp("OK")
+                sent = client_socket.send(b"".join(fragments))
+        except BlockingIOError:
+            sent = 0
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_client(client_socket)
+            return False
+        done = 0
+        for fragment in outbuf:
+            if sent < len(fragment):
+                break
+            sent -= len(fragment)
+            done += 1
+        del outbuf[:done]
+        if sent:
+            outbuf[0] = memoryview(outbuf[0])[sent:]
+        if outbuf and fd not in self.writing:
+            self.writing.add(fd)
+            self.sel.modify(client_socket, selectors.EVENT_READ | selectors.EVENT_WRITE, self.handle_client)
+        elif not outbuf and fd in self.writing:
+            self.writing.discard(fd)
+            self.sel.modify(client_socket, selectors.EVENT_READ, self.handle_client)
+        return True
+
+    def close_client(self, client_socket):
+        """Unregisters the client socket from the selector, drops its buffers and closes it."""
+        fd = client_socket.fileno()
+        self.sel.unregister(client_socket)
+        del self.buffers[fd]
+        del self.outbufs[fd]
+        self.writing.discard(fd)
+        client_socket.close()
+
+    def process_command(self, command):
+        """
+        Process the parsed Redis command and generate a response.
+
+        Handlers index their arguments directly, so a command with missing arguments or a
+        non-integer where a number is expected is turned into an error reply here.
+        """
+        name = command[0]
+        if name == self._last_name:
+            handler = self._last_handler
         else:
-            return self.serialize_resp("Invalid command")
+            handler = self._dispatch.get(self._lc(name), self._cmd_invalid)
+            self._last_name, self._last_handler = name, handler
+        try:
+            return handler(command)
+        except IndexError:
+            return self.serialize_resp(Error(f"ERR wrong number of arguments for '{self._lc(name).decode()}' command"))
+        except ValueError:
+            return self.serialize_resp(Error("ERR value is not an integer or out of range"))
 
-    def serialize_resp(self, data):
-        """Serialize the data into RESP format."""
-        if data is None:
-            return "$-1\r\n"
-        elif isinstance(data, str):
-            return f"${len(data)}\r\n{data}\r\n"
-        elif isinstance(data, int):
-            return f":{data}\r\n"
-        elif isinstance(data, list):
-            serialized_elements = "".join(self.serialize_resp(item) for item in data)
-            return f"*{len(data)}\r\n{serialized_elements}"
-        elif isinstance(data, Error):
-            return f"-{data.message}\r\n"
+    def _lc(self, name):
+        """
+        Return the lowercase form of a command name or keyword, caching it for the next time.
+
+        Command names and SET options are cached up front in upper and lower case. Other
+        spellings are only added when they lower to one of those, so unknown names sent by
+        a client can never fill the cache.
+        """
+        lc = self._lower_cache.get(name)
+        if lc is None:
+            lc = name.lower()
+            if lc in self._lower_cache and len(self._lower_cache) < LOWER_CACHE_SIZE:
+                self._lower_cache[name] = lc
+        return lc
+
+    def _cmd_ping(self, args):
+        """PING: check that the server is alive."""
+        return RESP_PONG
+
+    def _cmd_echo(self, args):
+        """ECHO <message>: return the message to the client."""
+        return self.serialize_fragments(args[1])
+
+    def _cmd_exists(self, args):
+        """EXISTS <key>: check whether the key exists."""
+        return RESP_ONE if args[1] in self.data_storage else RESP_ZERO
+
+    def _cmd_del(self, args):
+        """DEL <key> [key ...]: delete the keys and return how many existed."""
+        count = 0
+        for key in islice(args, 1, None):
+            if key in self.data_storage:
+                del self.data_storage[key]
+                self._expiring.discard(key)
+                count += 1
+        return serialize_int(count)
+
+    def _cmd_incr(self, args):
+        """INCR <key>: increment the integer value of the key by one."""
+        return self._incr_by(args[1], 1)
+
+    def _cmd_decr(self, args):
+        """DECR <key>: decrement the integer value of the key by one."""
+        return self._incr_by(args[1], -1)
+
+    def _incr_by(self, key, delta):
+        """
+        Add delta to the integer value of the key.
+
+        A missing key starts from 0. A value set as bytes that holds a 64 bit decimal integer is
+        parsed once and stored as an int, so later INCR and DECR calls update it in place.
+        """
+        entry = self.data_storage.get(key)
+        if entry is None or (entry[1] is not None and time.time() > entry[1]):
+            self.data_storage[key] = [delta, None]
+            self._expiring.discard(key)
+            return serialize_int(delta)
+        value = entry[0]
+        if type(value) is not int:
+            if type(value) is not bytes or not INT_VALUE_RE.fullmatch(value):
+                return self.serialize_resp(Error("ERR value is not an integer or out of range"))
+            value = int(value)
+            if not INT64_MIN <= value <= INT64_MAX:
+                return self.serialize_resp(Error("ERR value is not an integer or out of range"))
+        value += delta
+        if not INT64_MIN <= value <= INT64_MAX:
+            return self.serialize_resp(Error("ERR increment or decrement would overflow"))
+        entry[0] = value
+        return serialize_int(value)
+
+    def _cmd_lpush(self, args):
+        """LPUSH <key> <value> [value ...]: insert the values at the head of the list."""
+        return self._push(args, left=True)
+
+    def _cmd_rpush(self, args):
+        """RPUSH <key> <value> [value ...]: insert the values at the tail of the list."""
+        return self._push(args, left=False)
+
+    def _push(self, args, left):
+        """Insert the values at the head or the tail of the list stored at the key."""
+        key = args[1]
+        entry = self.data_storage.get(key)
+        if entry is None:
+            values = deque(islice(args, 2, None))
+            self.data_storage[key] = [values, None]
+            return serialize_int(len(values))
+        existing_values = entry[0]
+        if type(existing_values) is not deque:
+            return self.serialize_resp("existing value is not a list")
+        if left:
+            # Walk the arguments backwards so the values keep their order at the head
+            existing_values.extendleft(islice(reversed(args), len(args) - 2))
         else:
-            raise TypeError("Unsupported RESP type")
+            existing_values.extend(islice(args, 2, None))
+        return serialize_int(len(existing_values))
 
-    def deserialize_resp(self, message):
-        """Deserialize the RESP message into Python data."""
-        if isinstance(message, bytes):
-            message = message.decode("utf-8")
-        if message.startswith("*"):
-            parts = message[1:].split("\r\n")
-            num_elements = int(parts[0])
-            elements = []
-            i = 1
-            while num_elements > 0 and i < len(parts):
-                if parts[i].startswith("$"):
-                    length = int(parts[i][1:])
-                    i += 1
-                    elements.append(parts[i][:length])
-                i += 1
-                num_elements -= 1
-            return elements
-        elif message.startswith("$"):
-            length = int(message[1 : message.index("\r\n")])
-            if length == -1:
-                return None
-            start = message.index("\r\n") + 2
-            end = start + length
-            return message[start:end]
-        elif message.startswith("+"):
-            return message[1 : message.index("\r\n")]
-        elif message.startswith("-"):
-            return message[1 : message.index("\r\n")]
-        elif message.startswith(":"):
-            return int(message[1 : message.index("\r\n")])
+    def _cmd_get(self, args):
+        """GET <key>: return the value of the key."""
+        key = args[1]
+        value, expiry = self.data_storage.get(key, (None, None))
+        if expiry is not None:
+            if time.time() > expiry:
+                del self.data_storage[key]
+                self._expiring.discard(key)
+                return RESP_NIL
+        if type(value) is int:  # Counters are stored as ints but read back as strings, like Redis
+            return serialize_bulk(b"%d" % value)
+        return self.serialize_fragments(value)
+
+    def _cmd_set(self, args):
+        """SET <key> <value> [EX seconds | PX milliseconds | EXAT timestamp | PXAT timestamp]: set the key."""
+        key, value = args[1], args[2]
+        ex, px, exat, pxat = None, None, None, None
+        if len(args) > 3:
+            for i in range(3, len(args), 2):
+                option = self._lc(args[i])
+                if option == b"ex":
+                    ex = int(args[i + 1])
+                elif option == b"px":
+                    px = int(args[i + 1]) / 1000
+                elif option == b"exat":
+                    exat = int(args[i + 1])
+                    ex = exat - int(time.time())
+                elif option == b"pxat":
+                    pxat = int(args[i + 1])
+                    px = (pxat - int(time.time() * 1000)) / 1000
+        expiry = ex or px
+        if expiry is not None:
+            self.data_storage[key] = [value, time.time() + expiry]
+            self._expiring.add(key)
         else:
-            raise ValueError("Invalid RESP message")
+            self.data_storage[key] = [value, None]
+            self._expiring.discard(key)
+        return RESP_OK
+
+    def _bgsave_in_progress(self):
+        """Return True while a BGSAVE thread is still writing its snapshot."""
+        return self._bgsave_thread is not None and self._bgsave_thread.is_alive()
+
+    def _cmd_save(self, args):
+        """SAVE: save the data storage to disk."""
+        if self._bgsave_in_progress():
+            return self.serialize_resp(Error("ERR Background save already in progress"))
+        try:
+            self.write_snapshot(self.dump_file, ((key, value, expiry) for key, (value, expiry) in self.data_storage.items()))
+        except OSError as e:
+            return self.serialize_resp(Error(f"ERR Error saving the snapshot: {e.strerror or e}"))
+        return RESP_OK
+
+    def _cmd_bgsave(self, args):
+        """BGSAVE: save a copy of the data storage to disk from a background thread."""
+        if self._bgsave_in_progress():
+            return self.serialize_resp(Error("ERR Background save already in progress"))
+        entries = [
+            (key, value.copy() if type(value) is deque else value, expiry)
+            for key, (value, expiry) in self.data_storage.items()
+        ]
+        self._bgsave_thread = threading.Thread(target=self.write_snapshot, args=(self.dump_file, entries), daemon=True)
+        self._bgsave_thread.start()
+        return b"+Background saving started\r\n"
+
+    def _cmd_invalid(self, args):
+        """Reply to a command the server does not support."""
+        return self.serialize_resp("Invalid command")
+
+    def serialize_resp(self, data):
+        """Serialize the data into RESP format."""
+        return serialize(data)
+
+    def serialize_fragments(self, data):
+        """
+        Serialize the data into RESP format, as separate fragments when it is a large bulk string.
+
+        Large values are returned as a (header, value, CRLF) tuple so they reach the socket
+        without being copied into a new bytes object; everything else goes through serialize_resp.
+        """
+        if type(data) is bytes and len(data) >= LARGE_BULK_SIZE:
+            return (b"$%d\r\n" % len(data), data, b"\r\n")
+        return self.serialize_resp(data)
+
+    def write_snapshot(self, path, entries):
+        """
+        Write (key, value, expiry) entries to a binary snapshot file.
+
+        The snapshot is written to a temporary file that is fsynced and then renamed over `path`,
+        so a crash mid-save never leaves a truncated snapshot behind. If writing fails (a full
+        disk, for example), the temporary file is removed and the error is raised again.
+        Each entry is stored as a key length and type tag, the key, the length-prefixed value
+        and the expiry timestamp (0.0 for keys without one).
+        """
+        # Every writer (a worker process or a BGSAVE thread) gets its own temporary file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            buf = bytearray(SNAPSHOT_MAGIC)
+            for key, value, expiry in entries:
+                value_type = type(value)
+                if value_type is bytes:
+                    buf += SNAPSHOT_ENTRY.pack(len(key), SNAPSHOT_BYTES)
+                    buf += key
+                    buf += SNAPSHOT_LEN.pack(len(value))
+                    buf += value
+                elif value_type is int:
+                    buf += SNAPSHOT_ENTRY.pack(len(key), SNAPSHOT_INT)
+                    buf += key
+                    buf += SNAPSHOT_INT_VALUE.pack(value)
+                elif value_type is deque:
+                    buf += SNAPSHOT_ENTRY.pack(len(key), SNAPSHOT_LIST)
+                    buf += key
+                    buf += SNAPSHOT_LEN.pack(len(value))
+                    for item in value:
+                        buf += SNAPSHOT_LEN.pack(len(item))
+                        buf += item
+                else:
+                    raise TypeError(f"Cannot save value of type {value_type.__name__}")
+                buf += SNAPSHOT_EXPIRY.pack(expiry or 0.0)
+                if len(buf) >= SNAPSHOT_FLUSH_SIZE:
+                    self._write_all(fd, buf)
+                    buf.clear()
+            self._write_all(fd, buf)
+            os.fsync(fd)
+            os.close(fd)
+            fd = -1
+            os.rename(tmp_path, path)
+        except BaseException:
+            if fd != -1:
+                os.close(fd)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _write_all(self, fd, buf):
+        """Write the whole buffer to the file descriptor."""
+        with memoryview(buf) as mv:
+            written = 0
+            while written < len(mv):
+                written += os.write(fd, mv[written:])
+
+    def read_snapshot(self, data):
+        """Read the entries of a binary snapshot written by write_snapshot into a new data storage dict."""
+        if data[: len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError("Invalid snapshot file")
+        data_storage = {}
+        now = time.time()
+        pos = len(SNAPSHOT_MAGIC)
+        while pos < len(data):
+            key_length, value_type = SNAPSHOT_ENTRY.unpack_from(data, pos)
+            pos += SNAPSHOT_ENTRY.size
+            key = data[pos : pos + key_length]
+            pos += key_length
+            if value_type == SNAPSHOT_BYTES:
+                (length,) = SNAPSHOT_LEN.unpack_from(data, pos)
+                pos += SNAPSHOT_LEN.size
+                value = data[pos : pos + length]
+                pos += length
+            elif value_type == SNAPSHOT_INT:
+                (value,) = SNAPSHOT_INT_VALUE.unpack_from(data, pos)
+                pos += SNAPSHOT_INT_VALUE.size
+            elif value_type == SNAPSHOT_LIST:
+                (count,) = SNAPSHOT_LEN.unpack_from(data, pos)
+                pos += SNAPSHOT_LEN.size
+                value = deque()
+                for _ in range(count):
+                    (length,) = SNAPSHOT_LEN.unpack_from(data, pos)
+                    pos += SNAPSHOT_LEN.size
+                    value.append(data[pos : pos + length])
+                    pos += length
+            else:
+                raise ValueError("Invalid snapshot file")
+            (expiry,) = SNAPSHOT_EXPIRY.unpack_from(data, pos)
+            pos += SNAPSHOT_EXPIRY.size
+            if not expiry:
+                data_storage[key] = [value, None]
+            elif expiry > now:
+                data_storage[key] = [value, expiry]
+        return data_storage
 
     def load_data(self):
-        """Load previously saved data from a file ("dump.pkl")."""
-        if os.path.exists("dump.pkl"):
-            with open("dump.pkl", "rb") as f:
-                self.data_storage = pickle.load(f)
+        """Load previously saved data from the snapshot file (dump_file)."""
+        if os.path.exists(self.dump_file) and os.path.getsize(self.dump_file) > 0:
+            with open(self.dump_file, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    self.data_storage = self.read_snapshot(data)
+            self._expiring = {key for key, entry in self.data_storage.items() if entry[1] is not None}
+
+
+class RespProtocol(asyncio.BufferedProtocol):
+    """
+    asyncio protocol serving a single client connection of a RedisServer.
+
+    The event loop reads straight into the client's InputBuffer handed out by get_buffer,
+    and buffer_updated processes every complete command in it and writes all of the
+    responses in one call, the same way handle_client does for the selectors loop.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.inbuf = InputBuffer()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def get_buffer(self, sizehint):
+        """Returns the free space at the end of the input buffer."""
+        return self.inbuf.free_space()
+
+    def buffer_updated(self, nbytes):
+        """Processes every complete command received so far and writes back their responses."""
+        self.inbuf.wpos += nbytes
+        responses = []
+        valid = self.server.process_input(self.inbuf, responses)
+        if responses:
+            self.transport.writelines(responses)
+        if not valid:
+            self.transport.close()
+
+
+def run_server(args, reuse_port=False, dump_file=DUMP_FILE):
+    """Create a RedisServer from the command line arguments and run it until interrupted."""
+    redis_server = RedisServer(args.host, args.port, reuse_port=reuse_port, dump_file=dump_file)
+    if args.asyncio:
+        redis_server.start_asyncio()
+    else:
+        redis_server.start()
+
+
+def run_workers(args, workers):
+    """
+    Fork `workers` processes that each run their own RedisServer on the same port.
+
+    The listening sockets are bound with SO_REUSEPORT, so the kernel spreads the incoming
+    connections across the workers. Every worker has its own data storage: a key set through
+    a connection served by one worker is not visible to the others. For the same reason each
+    worker saves to and loads from its own snapshot file, "dump-<index>.rdb".
+    Ctrl+C or a SIGTERM sent to the parent stops all of the workers.
+    """
+    children = []
+    for index in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_server(args, reuse_port=True, dump_file=WORKER_DUMP_FILE.format(index))
+            except BaseException:
+                traceback.print_exc()
+                os._exit(1)
+            os._exit(0)
+        children.append(pid)
+
+    def stop_workers(signum=None, frame=None):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    # Pass a SIGTERM sent to the parent on to the workers, then keep reaping them below
+    signal.signal(signal.SIGTERM, stop_workers)
+    for pid in children:
+        while True:
+            try:
+                os.waitpid(pid, 0)
+                break
+            except KeyboardInterrupt:
+                print("Caught keyboard interrupt, stopping workers")
+                stop_workers()
 
 
-redis_server = RedisServer()
-redis_server.start()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="A simple Redis server.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=6379, help="port to listen on (default: 6379)")
+    parser.add_argument(
+        "--asyncio",
+        action="store_true",
+        help="serve clients on an asyncio event loop (uvloop when installed) instead of the selectors loop",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes sharing the port through SO_REUSEPORT, 0 for one per CPU "
+        "(default: 1); each worker keeps its own keys and saves them to dump-<index>.rdb",
+    )
+    args = parser.parse_args()
+    if args.workers < 0:
+        parser.error("--workers must be 0 or a positive number of processes")
+    workers = args.workers or os.cpu_count()
+    if workers == 1:
+        run_server(args)
+    elif not hasattr(os, "fork") or not hasattr(socket, "SO_REUSEPORT"):
+        parser.error("--workers needs os.fork and SO_REUSEPORT, which this platform does not have")
+    else:
+        run_workers(args, workers)
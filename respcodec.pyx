@@ -0,0 +1,113 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Compiled RESP command parser used by redis.py when it is available.
+
+Build it in place next to redis.py with:
+    CFLAGS="-O3 -march=native" cythonize -i respcodec.pyx
+"""
+from cpython.bytes cimport PyBytes_FromStringAndSize
+
+
+DEF MAX_LENGTH_DIGITS = 18  # Keeps the value well inside a 64 bit Py_ssize_t
+
+
+DEF MAX_BULK_LENGTH = 512 * 1024 * 1024  # Redis's proto-max-bulk-len, like redis.py
+
+
+cdef Py_ssize_t _parse_length(const unsigned char *p, Py_ssize_t pos, Py_ssize_t n, Py_ssize_t *out) except -1:
+    """
+    Parse the decimal length at `pos` into `out` and return the offset just past its CRLF.
+
+    Returns 0 if the length line has not been received completely yet.
+    The only negative length accepted is -1 (a null bulk string or array).
+    """
+    cdef Py_ssize_t value = 0
+    cdef Py_ssize_t digits = 0
+    cdef bint negative = False
+    cdef unsigned char c
+    if pos < n and p[pos] == 45:  # "-"
+        negative = True
+        pos += 1
+    while pos < n and p[pos] != 13:
+        c = p[pos]
+        if c < 48 or c > 57 or digits == MAX_LENGTH_DIGITS:
+            raise ValueError("Invalid RESP message")
+        value = value * 10 + (c - 48)
+        digits += 1
+        pos += 1
+    if pos + 1 >= n:
+        return 0
+    if p[pos + 1] != 10 or digits == 0 or (negative and value != 1):
+        raise ValueError("Invalid RESP message")
+    out[0] = -value if negative else value
+    return pos + 2
+
+
+cdef Py_ssize_t _parse_args(const unsigned char *p, Py_ssize_t pos, Py_ssize_t n, list args, Py_ssize_t count) except -1:
+    """Append up to `count` complete bulk strings at `pos` to `args` and return the offset past the last one."""
+    cdef Py_ssize_t length, data, i
+    for i in range(count):
+        if pos >= n:
+            break
+        if p[pos] != 36:  # "$"
+            raise ValueError("Invalid RESP message")
+        data = _parse_length(p, pos + 1, n, &length)
+        if data == 0:
+            break
+        if length == -1 or length > MAX_BULK_LENGTH:  # No null bulk strings inside a command
+            raise ValueError("Invalid RESP message")
+        if data + length + 2 > n:
+            break
+        if p[data + length] != 13 or p[data + length + 1] != 10:
+            raise ValueError("Invalid RESP message")
+        args.append(PyBytes_FromStringAndSize(<const char *>p + data, length))
+        pos = data + length + 2
+    return pos
+
+
+cpdef tuple parse_command(const unsigned char[:] buf, Py_ssize_t start=0, object end=None):
+    """
+    Parse the RESP array of bulk strings found at `start` in the buffer.
+
+    Only the bytes before `end` (the end of the buffer by default) are considered part of the
+    received data.
+
+    Returns a tuple of the list of bulk strings (as bytes) and the number of bytes consumed,
+    the same as parse_resp_command in redis.py, which accepts exactly the same input.
+    Raises IndexError if the buffer does not yet hold a complete message and ValueError if it
+    is not a valid one.
+    """
+    cdef Py_ssize_t n = buf.shape[0] if end is None else min(<Py_ssize_t>end, buf.shape[0])
+    cdef Py_ssize_t pos = start
+    cdef Py_ssize_t count
+    cdef const unsigned char *p
+    cdef list args
+    if pos >= n:
+        raise IndexError("Incomplete RESP message")
+    p = &buf[0]
+    if p[pos] != 42:  # "*"
+        raise ValueError("Invalid RESP message")
+    pos = _parse_length(p, pos + 1, n, &count)
+    if pos == 0:
+        raise IndexError("Incomplete RESP message")
+    if count == -1:
+        return None, pos - start
+    args = []
+    pos = _parse_args(p, pos, n, args, count)
+    if len(args) < count:
+        raise IndexError("Incomplete RESP message")
+    return args, pos - start
+
+
+cpdef Py_ssize_t parse_args(const unsigned char[:] buf, Py_ssize_t start, object end, list args, Py_ssize_t count) except -1:
+    """
+    Append up to `count` of the bulk strings found at `start` in the buffer to `args`.
+
+    Parsing stops at the first bulk string that has not been received completely, so a large
+    command can be parsed a piece at a time as it arrives, the same as parse_resp_args in
+    redis.py. Returns the number of bytes consumed by the appended arguments.
+    """
+    cdef Py_ssize_t n = buf.shape[0] if end is None else min(<Py_ssize_t>end, buf.shape[0])
+    if start >= n:
+        return 0
+    return _parse_args(&buf[0], start, n, args, count) - start